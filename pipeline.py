@@ -1,15 +1,22 @@
 from __future__ import annotations
 
 import argparse
-import json
+import asyncio
 import logging
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Any, Dict, List, Tuple
 
+import aiohttp
+import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import requests
+from requests.adapters import HTTPAdapter
 
 # ----------------------------
 # Configuration (override via CLI or env if desired)
@@ -26,11 +33,15 @@ HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "15"))
 OUTPUT_DIR_DEFAULT = os.getenv("OUTPUT_DIR", "output")
 OUTPUT_CSV_DEFAULT = os.getenv("OUTPUT_CSV", "customer_feedback.csv")
 DIAG_FILENAME = "run_diagnostics.json"
+JOIN_KEY_DTYPE = "string[pyarrow]"
 
 
 # ----------------------------
 # Logging
 # ----------------------------
+logger = logging.getLogger(__name__)
+
+
 def setup_logging(verbosity: int) -> None:
     """
     Configure logging.
@@ -57,25 +68,64 @@ class FetchResult:
 # ----------------------------
 # HTTP & Validation
 # ----------------------------
+# Shared session so repeated calls to the same host reuse the TCP/TLS connection.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=2))
+
+
 def fetch_json(url: str, timeout: float) -> FetchResult:
     """
     GET a JSON payload with basic error handling.
     Returns a FetchResult with ok flag and details for diagnostics.
     """
     try:
-        resp = requests.get(url, timeout=timeout)
+        resp = _SESSION.get(url, timeout=timeout)
         status = resp.status_code
         resp.raise_for_status()
         try:
-            return FetchResult(ok=True, data=resp.json(), status=status, error=None)
-        except ValueError as ve:
-            logging.error("Invalid JSON from %s: %s", url, ve)
+            return FetchResult(ok=True, data=orjson.loads(resp.content), status=status, error=None)
+        except orjson.JSONDecodeError as ve:
+            logger.error("Invalid JSON from %s: %s", url, ve)
             return FetchResult(ok=False, data=None, status=status, error="invalid_json")
     except requests.RequestException as re:
-        logging.error("HTTP error for %s: %s", url, re)
+        logger.error("HTTP error for %s: %s", url, re)
         return FetchResult(ok=False, data=None, status=None, error=str(re))
 
 
+async def _fetch_json_async(session: aiohttp.ClientSession, url: str, timeout: float) -> FetchResult:
+    """
+    Async counterpart of `fetch_json` for use with a shared aiohttp session.
+    """
+    try:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            status = resp.status
+            resp.raise_for_status()
+            try:
+                data = orjson.loads(await resp.read())
+                return FetchResult(ok=True, data=data, status=status, error=None)
+            except orjson.JSONDecodeError as ve:
+                logger.error("Invalid JSON from %s: %s", url, ve)
+                return FetchResult(ok=False, data=None, status=status, error="invalid_json")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error("HTTP error for %s: %s", url, e)
+        return FetchResult(ok=False, data=None, status=None, error=str(e) or type(e).__name__)
+
+
+async def _fetch_all(timeout: float) -> Tuple[FetchResult, FetchResult]:
+    """
+    Fetch feedback and customer payloads concurrently over one pooled session.
+    Returns (feedback_result, customer_result).
+    """
+    connector = aiohttp.TCPConnector(limit=4, keepalive_timeout=30)
+    # trust_env: honour HTTP(S)_PROXY / NO_PROXY / .netrc like requests does
+    async with aiohttp.ClientSession(connector=connector, trust_env=True) as session:
+        feedback_res, customer_res = await asyncio.gather(
+            _fetch_json_async(session, FEEDBACK_URL, timeout),
+            _fetch_json_async(session, CUSTOMER_URL, timeout),
+        )
+    return feedback_res, customer_res
+
+
 def expect_list_under_key(obj: Any, key: str) -> Tuple[bool, List[Dict[str, Any]] | None, str | None]:
     """
     Validate that `obj` is a dict and contains a list-of-dicts under `key`.
@@ -97,19 +147,29 @@ def expect_list_under_key(obj: Any, key: str) -> Tuple[bool, List[Dict[str, Any]
 # ----------------------------
 # Transformations
 # ----------------------------
+def _as_str_keys(s: pd.Series) -> pd.Series:
+    """
+    Cast a key column to Arrow-backed strings, skipping the pass if it already is one.
+    """
+    if s.dtype == JOIN_KEY_DTYPE:
+        return s
+    return s.astype(JOIN_KEY_DTYPE)
+
+
 def normalize_feedback_df(df: pd.DataFrame) -> pd.DataFrame:
     """
     Ensure feedback DF has 'customer_id' column:
     - If there's an 'id' column, rename to 'customer_id'.
     - Otherwise, leave as-is and rely on presence check later.
     """
-    if "customer_id" in df.columns:
+    cols = set(df.columns)
+    if "customer_id" in cols:
         return df
-    if "id" in df.columns:
+    if "id" in cols:
         df = df.rename(columns={"id": "customer_id"})
-        logging.debug("Renamed feedback.id -> customer_id")
+        logger.debug("Renamed feedback.id -> customer_id")
     else:
-        logging.warning("Feedback data lacks 'customer_id' (or 'id'). Join may fail.")
+        logger.warning("Feedback data lacks 'customer_id' (or 'id'). Join may fail.")
     return df
 
 
@@ -117,30 +177,30 @@ def normalize_customer_df(df: pd.DataFrame) -> pd.DataFrame:
     """
     Ensure customer DF has 'customer_id' column:
     - If 'customerId' exists, rename to 'customer_id'.
-    - Remove literal 'cid' prefix if present (non-regex).
+    - Remove a leading literal 'cid' prefix if present.
     - Cast to string for safe joining.
     """
-    if "customer_id" not in df.columns and "customerId" in df.columns:
+    cols = set(df.columns)
+    if "customer_id" not in cols:
+        if "customerId" not in cols:
+            logger.warning("Customer data lacks 'customer_id' (or 'customerId'). Join may fail.")
+            return df
         df = df.rename(columns={"customerId": "customer_id"})
-        logging.debug("Renamed customer.customerId -> customer_id")
-
-    if "customer_id" not in df.columns:
-        logging.warning("Customer data lacks 'customer_id' (or 'customerId'). Join may fail.")
-        return df
+        logger.debug("Renamed customer.customerId -> customer_id")
 
     # Clean literal 'cid' prefix if present (e.g., "cid123" -> "123")
-    df["customer_id"] = df["customer_id"].astype(str).str.replace("cid", "", regex=False)
+    df["customer_id"] = _as_str_keys(df["customer_id"]).str.removeprefix("cid")
     return df
 
 
 def standardize_join_keys(feedback_df: pd.DataFrame, customer_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
-    Coerce join keys to string for both frames.
+    Coerce join keys to Arrow-backed strings for both frames.
     """
     if "customer_id" in feedback_df.columns:
-        feedback_df["customer_id"] = feedback_df["customer_id"].astype(str)
+        feedback_df["customer_id"] = _as_str_keys(feedback_df["customer_id"])
     if "customer_id" in customer_df.columns:
-        customer_df["customer_id"] = customer_df["customer_id"].astype(str)
+        customer_df["customer_id"] = _as_str_keys(customer_df["customer_id"])
     return feedback_df, customer_df
 
 
@@ -150,14 +210,25 @@ def derive_fields(df: pd.DataFrame) -> pd.DataFrame:
     """
     needed = {"survey_q1", "survey_q2"}
     if needed.issubset(df.columns):
-        df = df.copy()
-        df["survey_q1"] = pd.to_numeric(df["survey_q1"], errors="coerce")
-        df["survey_q2"] = pd.to_numeric(df["survey_q2"], errors="coerce")
-        df["avg_survey_score"] = df[["survey_q1", "survey_q2"]].mean(axis=1, skipna=True)
-        logging.info("Derived column 'avg_survey_score'.")
+        df = df.copy(deep=False)  # new/replaced columns only; no need to duplicate the data
+        # Coerce each score column at most once, straight into one (N, 2) float64 block
+        scores = np.empty((len(df), 2), dtype=np.float64)
+        for i, col in enumerate(("survey_q1", "survey_q2")):
+            s = df[col]
+            if not pd.api.types.is_numeric_dtype(s.dtype):
+                s = pd.to_numeric(s, errors="coerce")
+                df[col] = s
+            scores[:, i] = s.to_numpy(dtype=np.float64, na_value=np.nan)
+        # Row-wise mean skipping NaN
+        is_nan = np.isnan(scores)
+        total = np.where(is_nan, 0.0, scores).sum(axis=1)
+        count = 2 - is_nan.sum(axis=1)
+        with np.errstate(invalid="ignore"):
+            df["avg_survey_score"] = total / count
+        logger.info("Derived column 'avg_survey_score'.")
     else:
         missing = needed - set(df.columns)
-        logging.debug("Skipping derived fields; missing columns: %s", sorted(missing))
+        logger.debug("Skipping derived fields; missing columns: %s", sorted(missing))
     return df
 
 
@@ -181,7 +252,7 @@ def merge_with_diagnostics(
             "feedback_has_customer_id": "customer_id" in feedback_df.columns,
             "customer_has_customer_id": "customer_id" in customer_df.columns,
         }
-        logging.error("Missing 'customer_id' in one or both datasets; cannot merge.")
+        logger.error("Missing 'customer_id' in one or both datasets; cannot merge.")
         return pd.DataFrame(), diagnostics
 
     # Shape stats
@@ -192,32 +263,33 @@ def merge_with_diagnostics(
         "customer_unique_ids": int(customer_df["customer_id"].nunique(dropna=True)),
     }
 
-    # Mismatch analysis
-    _left = feedback_df[["customer_id"]].assign(_src="left")
-    _right = customer_df[["customer_id"]].assign(_src="right")
-    union = pd.concat([_left, _right], ignore_index=True)
-    counts = union.groupby(["customer_id"], dropna=False)["_src"].nunique()
-    only_left_ids = counts[counts == 1].index.intersection(_left["customer_id"])
-    only_right_ids = counts[counts == 1].index.intersection(_right["customer_id"])
+    # Mismatch analysis (set difference on unique keys, samples in first-seen order)
+    left_ids = feedback_df["customer_id"].unique()
+    right_ids = customer_df["customer_id"].unique()
+    left_set, right_set = set(left_ids), set(right_ids)
+    if left_set == right_set:
+        # Common clean-data case: identical key sets, nothing to sample
+        only_left_ids, only_right_ids = [], []
+    else:
+        only_left_ids = [k for k in left_ids if k not in right_set]
+        only_right_ids = [k for k in right_ids if k not in left_set]
 
     diagnostics["key_mismatches"] = {
         "left_only_count": int(len(only_left_ids)),
         "right_only_count": int(len(only_right_ids)),
-        "left_only_sample": list(map(str, list(only_left_ids)[:5])),
-        "right_only_sample": list(map(str, list(only_right_ids)[:5])),
+        "left_only_sample": list(map(str, only_left_ids[:5])),
+        "right_only_sample": list(map(str, only_right_ids[:5])),
     }
 
     if diagnostics["key_mismatches"]["left_only_count"] or diagnostics["key_mismatches"]["right_only_count"]:
-        logging.warning(
+        logger.warning(
             "Join key mismatches detected: left_only=%d, right_only=%d",
             diagnostics["key_mismatches"]["left_only_count"],
             diagnostics["key_mismatches"]["right_only_count"],
         )
 
     # Merge
-    merged = feedback_df.merge(
-        customer_df, on="customer_id", how="inner", validate="many_to_many"
-    )
+    merged = feedback_df.merge(customer_df, on="customer_id", how="inner")
 
     diagnostics["post_merge"] = {
         "merged_rows": int(len(merged)),
@@ -225,7 +297,7 @@ def merge_with_diagnostics(
         "merge_ratio_vs_customer": float(len(merged)) / max(1, len(customer_df)),
     }
 
-    logging.info(
+    logger.info(
         "Merged rows: %d (feedback=%d, customers=%d)",
         diagnostics["post_merge"]["merged_rows"],
         diagnostics["pre_merge"]["feedback_rows"],
@@ -248,11 +320,16 @@ def run(output_dir: str, output_csv: str) -> int:
         "customer_url": CUSTOMER_URL,
     }
 
+    # Create the output directory once; every later write (CSV and diagnostics) assumes it exists
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+    except OSError as e:
+        logger.error("Cannot create output directory %s: %s", output_dir, e)
+        return 4  # write failure
+
     # Fetch
-    logging.info("Fetching feedback data…")
-    feedback_res = fetch_json(FEEDBACK_URL, HTTP_TIMEOUT_SECONDS)
-    logging.info("Fetching customer data…")
-    customer_res = fetch_json(CUSTOMER_URL, HTTP_TIMEOUT_SECONDS)
+    logger.info("Fetching feedback and customer data…")
+    feedback_res, customer_res = asyncio.run(_fetch_all(HTTP_TIMEOUT_SECONDS))
     diag["http"] = {
         "feedback": {"ok": feedback_res.ok, "status": feedback_res.status, "error": feedback_res.error},
         "customer": {"ok": customer_res.ok, "status": customer_res.status, "error": customer_res.error},
@@ -268,7 +345,7 @@ def run(output_dir: str, output_csv: str) -> int:
     diag["shape"] = {"feedback": err_f or "ok", "customers": err_c or "ok"}
 
     if not (ok_f and ok_c):
-        logging.error("Unexpected response shapes: feedback=%s, customers=%s", err_f, err_c)
+        logger.error("Unexpected response shapes: feedback=%s, customers=%s", err_f, err_c)
         _write_diagnostics(output_dir, diag)
         return 2  # shape error
 
@@ -276,8 +353,9 @@ def run(output_dir: str, output_csv: str) -> int:
     feedback_df = pd.DataFrame(feedback_list or [])
     customer_df = pd.DataFrame(customer_list or [])
 
-    logging.debug("Feedback columns: %s", feedback_df.columns.tolist())
-    logging.debug("Customer columns: %s", customer_df.columns.tolist())
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Feedback columns: %s", feedback_df.columns.tolist())
+        logger.debug("Customer columns: %s", customer_df.columns.tolist())
 
     feedback_df = normalize_feedback_df(feedback_df)
     customer_df = normalize_customer_df(customer_df)
@@ -287,7 +365,7 @@ def run(output_dir: str, output_csv: str) -> int:
     diag.update(join_diag)
 
     if merged_df.empty:
-        logging.error("Merge produced 0 rows; check join keys and source coverage.")
+        logger.error("Merge produced 0 rows; check join keys and source coverage.")
         _write_diagnostics(output_dir, diag)
         return 3  # useless/empty merge
 
@@ -295,29 +373,60 @@ def run(output_dir: str, output_csv: str) -> int:
 
     # Output
     try:
-        os.makedirs(output_dir, exist_ok=True)
         out_path = os.path.join(output_dir, output_csv)
-        merged_df.to_csv(out_path, index=False)
+        # Different target files: write diagnostics while the CSV is being written.
+        # 'output_csv' is only recorded once the CSV is complete, so a crash mid-write
+        # never leaves diagnostics pointing at a partial file.
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            csv_future = pool.submit(_write_csv, merged_df, out_path)
+            _write_diagnostics(output_dir, diag)
+            csv_future.result()
         diag["output_csv"] = out_path
         _write_diagnostics(output_dir, diag)
-        logging.info("CSV written: %s", out_path)
+        logger.info("CSV written: %s", out_path)
         return 0
     except Exception as e:  # noqa: BLE001
-        logging.error("Failed to write CSV: %s", e)
+        logger.error("Failed to write CSV: %s", e)
         _write_diagnostics(output_dir, diag)
         return 4  # write failure
 
 
+def _csv_cell(value: Any) -> str:
+    """Render one value of a mixed object column as CSV text (nested JSON stays JSON)."""
+    if isinstance(value, (list, dict)):
+        return orjson.dumps(value).decode()
+    return str(value)
+
+
+def _write_csv(df: pd.DataFrame, path: str) -> None:
+    """
+    Write `df` as CSV via Arrow's C++ writer.
+    Object columns Arrow can't format (nested values, mixed types) are stringified first,
+    so the output format doesn't depend on the payload; pandas is only used if Arrow still fails.
+    """
+    mixed = [
+        col for col in df.columns[df.dtypes == object]
+        if pd.api.types.infer_dtype(df[col], skipna=True).startswith("mixed")
+    ]
+    if mixed:
+        logger.debug("Stringifying mixed/nested columns for CSV: %s", mixed)
+        df = df.assign(**{col: df[col].map(_csv_cell, na_action="ignore") for col in mixed})
+    try:
+        pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+    except pa.ArrowException as e:
+        logger.warning("Arrow CSV write failed (%s); falling back to pandas CSV writer.", e)
+        df.to_csv(path, index=False)
+
+
 def _write_diagnostics(output_dir: str, diag: Dict[str, Any]) -> None:
     """Write a small JSON diagnostics file to help operators triage quickly."""
     try:
-        os.makedirs(output_dir, exist_ok=True)
         path = os.path.join(output_dir, DIAG_FILENAME)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(diag, f, indent=2, ensure_ascii=False)
-        logging.debug("Diagnostics written: %s", path)
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(diag, option=orjson.OPT_INDENT_2))
+        logger.debug("Diagnostics written: %s", path)
     except Exception as e:  # noqa: BLE001
-        logging.warning("Could not write diagnostics file: %s", e)
+        logger.warning("Could not write diagnostics file: %s", e)
 
 
 # ----------------------------
@@ -1,12 +1,19 @@
 # test_pipeline.py
 
-from unittest.mock import patch, MagicMock
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
 
 import pandas as pd
+import pytest
 
 # Import functions from your pipeline module
 # (adjust the import if your file has a different name, e.g. `pipeline.py`)
+import pipeline
 from pipeline import (
+    fetch_json,
     run,
     merge_with_diagnostics,
     normalize_feedback_df,
@@ -16,31 +23,68 @@ from pipeline import (
 
 
 # ---------------------------------------------------
-# 1. Happy-path end-to-end run
+# Local HTTP server standing in for the feedback/customer APIs
 # ---------------------------------------------------
-def test_run_happy_path(tmp_path):
-    """End-to-end test of run() with mocked HTTP returning valid JSON."""
+@pytest.fixture
+def api(monkeypatch):
+    """
+    Serve canned responses on localhost and point the pipeline URLs at them.
+    Tests fill `routes[path] = (status, body_bytes, delay_seconds)`.
+    """
+    routes = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, body, delay = routes[self.path]
+            time.sleep(delay)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            pass  # client gone after a timeout
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(pipeline, "FEEDBACK_URL", f"{base}/feedback")
+    monkeypatch.setattr(pipeline, "CUSTOMER_URL", f"{base}/customers")
+    yield routes
+    server.shutdown()
+    server.server_close()
 
-    feedback_payload = {"feedback": [{"id": "1", "survey_q1": 5, "survey_q2": 3}]}
-    customer_payload = {"customers": [{"customerId": "1", "name": "Alice"}]}
 
-    with patch("requests.get") as mock_get:
-        mock_resp_feedback = MagicMock()
-        mock_resp_feedback.status_code = 200
-        mock_resp_feedback.json.return_value = feedback_payload
+def _ok(payload):
+    return 200, json.dumps(payload).encode(), 0
 
-        mock_resp_customer = MagicMock()
-        mock_resp_customer.status_code = 200
-        mock_resp_customer.json.return_value = customer_payload
 
-        mock_get.side_effect = [mock_resp_feedback, mock_resp_customer]
+def _read_diag(tmp_path):
+    return json.loads((tmp_path / "run_diagnostics.json").read_text(encoding="utf-8"))
+
+
+# ---------------------------------------------------
+# 1. Happy-path end-to-end run
+# ---------------------------------------------------
+def test_run_happy_path(tmp_path, api):
+    """End-to-end test of run() against a local HTTP server returning valid JSON."""
+
+    api["/feedback"] = _ok({"feedback": [{"id": "1", "survey_q1": 5, "survey_q2": 3}]})
+    api["/customers"] = _ok({"customers": [{"customerId": "1", "name": "Alice"}]})
 
-        exit_code = run(str(tmp_path), "test.csv")
+    exit_code = run(str(tmp_path), "test.csv")
 
     # Assert success
     assert exit_code == 0
     assert (tmp_path / "test.csv").exists()
-    assert (tmp_path / "run_diagnostics.json").exists()
+    assert _read_diag(tmp_path)["output_csv"] == str(tmp_path / "test.csv")
 
     # Check derived column
     df = pd.read_csv(tmp_path / "test.csv")
@@ -83,12 +127,109 @@ def test_normalization_and_derived_fields():
     assert norm_feedback["customer_id"].iloc[0] == "cid123"
 
     # Customer: customerId should rename and strip cid prefix
-    customer_df = pd.DataFrame([{"customerId": "cid123"}])
+    customer_df = pd.DataFrame([{"customerId": "cid123"}, {"customerId": "12cid3"}])
     norm_customer = normalize_customer_df(customer_df)
     assert "customer_id" in norm_customer.columns
     assert norm_customer["customer_id"].iloc[0] == "123"
+    assert norm_customer["customer_id"].iloc[1] == "12cid3"  # only a leading prefix is stripped
 
     # Derived field average
     derived = derive_fields(norm_feedback)
     assert "avg_survey_score" in derived.columns
     assert derived["avg_survey_score"].iloc[0] == 6.0
+
+
+# ---------------------------------------------------
+# 4. HTTP error paths (status error, invalid JSON, timeout)
+# ---------------------------------------------------
+def test_run_http_error_status(tmp_path, api):
+    """A 5xx response is reported as a network error (exit code 1)."""
+
+    api["/feedback"] = (500, b"oops", 0)
+    api["/customers"] = _ok({"customers": []})
+
+    assert run(str(tmp_path), "test.csv") == 1
+    http = _read_diag(tmp_path)["http"]
+    assert http["feedback"]["ok"] is False
+    assert "500" in http["feedback"]["error"]
+    assert http["customer"] == {"ok": True, "status": 200, "error": None}
+
+
+def test_run_invalid_json(tmp_path, api):
+    """A 200 with an undecodable body keeps the status and reports invalid_json."""
+
+    api["/feedback"] = _ok({"feedback": []})
+    api["/customers"] = (200, b"{not json", 0)
+
+    assert run(str(tmp_path), "test.csv") == 1
+    assert _read_diag(tmp_path)["http"]["customer"] == {"ok": False, "status": 200, "error": "invalid_json"}
+
+
+def test_run_timeout(tmp_path, api, monkeypatch):
+    """A response slower than the timeout is reported by exception name."""
+
+    monkeypatch.setattr(pipeline, "HTTP_TIMEOUT_SECONDS", 0.1)
+    api["/feedback"] = (200, b"{}", 1.0)
+    api["/customers"] = _ok({"customers": []})
+
+    assert run(str(tmp_path), "test.csv") == 1
+    assert _read_diag(tmp_path)["http"]["feedback"] == {"ok": False, "status": None, "error": "TimeoutError"}
+
+
+# ---------------------------------------------------
+# 5. Nested JSON values fall back to the pandas CSV writer
+# ---------------------------------------------------
+def test_run_nested_fields(tmp_path, api):
+    """Nested and mixed-type values are stringified so Arrow still writes the whole CSV."""
+
+    api["/feedback"] = _ok({"feedback": [
+        {"id": "1", "survey_q1": 5, "survey_q2": 3, "tags": ["a", "b"]},
+        {"id": "2", "survey_q1": 4, "survey_q2": 4, "tags": []},
+    ]})
+    api["/customers"] = _ok({"customers": [
+        {"customerId": "1", "addr": {"city": "X"}, "code": 7},
+        {"customerId": "2", "addr": {"city": "Y"}, "code": "A1"},
+    ]})
+
+    assert run(str(tmp_path), "test.csv") == 0
+    # Same (Arrow) format as any other run: quoted header and strings
+    assert (tmp_path / "test.csv").read_text().startswith('"customer_id",')
+    df = pd.read_csv(tmp_path / "test.csv", dtype=str)
+    assert len(df) == 2
+    assert df["tags"].tolist() == ['["a","b"]', "[]"]
+    assert df["addr"].iloc[0] == '{"city":"X"}'
+    assert df["code"].tolist() == ["7", "A1"]
+
+
+# ---------------------------------------------------
+# 6. Non-dict record in the middle of a list
+# ---------------------------------------------------
+def test_run_non_dict_record(tmp_path, api):
+    """A stray non-dict record past the spot-checked ends is a shape error on that side."""
+
+    api["/feedback"] = _ok({"feedback": [{"id": "1"}, 5, {"id": "2"}]})
+    api["/customers"] = _ok({"customers": [{"customerId": "1"}]})
+
+    assert run(str(tmp_path), "test.csv") == 2
+    assert _read_diag(tmp_path)["shape"] == {"feedback": "list_elements_not_dict:feedback", "customers": "ok"}
+    assert not (tmp_path / "test.csv").exists()
+
+
+# ---------------------------------------------------
+# 7. Synchronous fetch_json helper
+# ---------------------------------------------------
+def test_fetch_json(api):
+    """fetch_json decodes a JSON body and reports HTTP errors without raising."""
+
+    api["/feedback"] = _ok({"feedback": []})
+    api["/customers"] = (500, b"oops", 0)
+
+    # Requests go through the module's pooled session
+    with patch.object(pipeline._SESSION, "get", wraps=pipeline._SESSION.get) as session_get:
+        ok = fetch_json(pipeline.FEEDBACK_URL, 5)
+    session_get.assert_called_once_with(pipeline.FEEDBACK_URL, timeout=5)
+    assert (ok.ok, ok.data, ok.status) == (True, {"feedback": []}, 200)
+
+    err = fetch_json(pipeline.CUSTOMER_URL, 5)
+    assert (err.ok, err.status) == (False, None)
+    assert "500" in err.error